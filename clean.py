@@ -0,0 +1,109 @@
+"""
+Audit and clean the values of "phone" and "url" tags.
+
+write_csv.py calls these functions while it shapes the elements, so the OSM file only has to be parsed
+once: every phone number and url is cleaned before it is written to the csv and then audited, i.e.
+reported if it still does not have the expected format.
+"""
+
+import re
+import string
+
+# Format a phone number should have after cleaning: area code, blank, number
+phone_numbers_re = re.compile(r"^([+0-9]{3}|[0-9]{3,5})\s[0-9]")
+# Shape a url should have after cleaning: http(s) scheme, dotted host without whitespace or a nested scheme,
+# optional port and an optional path, query or fragment
+url_re = re.compile(r"^https?://[^\s/?#:@]+\.[^\s/?#:@]+(?::\d+)?(?:[/?#]\S*)?$", re.IGNORECASE)
+
+# Translation table replacing all characters except digits, blanks, plus and minus sign with a blank
+_KEEP_CHARS = set(string.digits + " +-")
+_NON_DECIMAL_TABLE = str.maketrans({c: " " for c in map(chr, range(128)) if c not in _KEEP_CHARS})
+
+# Pattern used by clean_phone_number, compiled once instead of on every call
+_AREA_DASH_RE = re.compile(r"^([+0-9]{3}|[0-9]{3,5})-")
+
+# Prefixes of area codes that are already followed by a blank
+_PREFIXES_FIXED = frozenset(["9131", "9135", "911", "9133", "320", "700", "800", "900", "1511", "1512", "1514",
+                             "1515", "1517", "160", "170", "171", "175", "1520", "1522", "1523", "1525", "162",
+                             "172", "173", "174", "1570", "1573", "1575", "1577", "1578", "163", "177", "178",
+                             "1590", "176", "179", "1516", "180"])
+# Prefixes used, when no country code is included, mapped to the index a blank is inserted at
+_NATIONAL_PREFIX_INDEX = {prefix: len(prefix) for prefix in [
+    "0911", "0320", "0700", "0800", "0900", "0160", "0170", "0171", "0175", "0162", "0172", "0173", "0174", "0163",
+    "0177", "0178", "0176", "0179", "0180",
+    "09131", "09135", "09133", "01511", "01512", "01514", "01515", "01517", "01520", "01522", "01523", "01525",
+    "01570", "01573", "01575", "01577", "01578", "01590", "01516", "09128"]}
+# Prefixes used, when country code is included, mapped to the index a blank is inserted at
+_INTERNATIONAL_PREFIX_INDEX = {prefix: len("+49") + len(prefix) for prefix in [
+    "911", "951", "320", "700", "800", "900", "160", "170", "171", "175", "162", "172", "173", "174", "163", "177",
+    "178", "176", "179", "180",
+    "9131", "9135", "9133", "9132", "1511", "1512", "1514", "1515", "1517", "1520", "1522", "1523", "1525", "1570",
+    "1573", "1575", "1577", "1578", "1590", "1516", "9128"]}
+
+
+# ================================================== #
+#               Audit Functions                      #
+# ================================================== #
+def audit_phone_number(phone_number):
+    """Return True if a (cleaned) phone number has the expected format"""
+    return phone_numbers_re.search(phone_number) is not None
+
+
+def audit_url(url):
+    """Return True if a (cleaned) url looks valid"""
+    return url_re.match(url) is not None
+
+
+# ================================================== #
+#          Data Cleaning Functions                   #
+# ================================================== #
+def clean_url(url):
+    #keep urls that already have a scheme, only prefix bare host names
+    if "://" in url or url.lower().startswith("mailto:"):
+        return url
+    return "http://" + (url if url.lower().startswith("www.") else "www." + url)
+
+def _fast_clean_phone(phone_number):
+    """Clean a phone number, working on its blank separated parts instead of rebuilding the string per step"""
+
+    #remove all non-digit characters except plus and minus sign
+    phone_number = phone_number.translate(_NON_DECIMAL_TABLE)
+    if not phone_number.isascii():
+        phone_number = "".join(c if c.isascii() or c.isdecimal() else " " for c in phone_number)
+    parts = phone_number.split()
+    if not parts:
+        return ""
+
+    #check if minus sign is between area code and phone number, if yes, replace it by a blank
+    if _AREA_DASH_RE.search(parts[0]):
+        area_code, _, number = parts[0].partition("-")
+        parts[0:1] = [area_code, number] if number else [area_code]
+
+    #if there already is a space between prefix and phone number, keep the parts as they are
+    if any(part[-3:] in _PREFIXES_FIXED or part[-4:] in _PREFIXES_FIXED for part in parts[:-1]):
+        return " ".join(parts)
+
+    #otherwise remove all blanks and insert them after country code and prefix,
+    #joining the pieces once instead of building a new string per inserted blank
+    phone_number = "".join(parts)
+    if phone_number[0] == "+":
+        index = (_INTERNATIONAL_PREFIX_INDEX.get(phone_number[3:6])
+                 or _INTERNATIONAL_PREFIX_INDEX.get(phone_number[3:7]))
+        if index:
+            phone_number = " ".join((phone_number[:3], phone_number[3:index], phone_number[index:]))
+        else:
+            phone_number = " ".join((phone_number[:3], phone_number[3:]))
+    else:
+        index = _NATIONAL_PREFIX_INDEX.get(phone_number[:4]) or _NATIONAL_PREFIX_INDEX.get(phone_number[:5])
+        if index:
+            phone_number = " ".join((phone_number[:index], phone_number[index:]))
+
+    #special case : convert 0049 to +49
+    if "0049" in phone_number:
+        phone_number = phone_number.replace("0049", "+49 ")
+    if " -" in phone_number:
+        phone_number = phone_number.replace("-", "", 1)
+    return phone_number
+
+def clean_phone_number(phone_number):
+    return _fast_clean_phone(phone_number)
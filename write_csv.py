@@ -16,8 +16,9 @@ The process for this transformation is as follows:
 We've already provided the code needed to load the data, perform iterative parsing and write the
 output to csv files. Your task is to complete the shape_element function that will transform each
 element into the correct format. To make this process easier we've already defined a schema (see
-the schema.py file in the last code tab) for the .csv files and the eventual tables. Using the
-cerberus library we can validate the output against this schema to ensure it is correct.
+the schema.py file in the last code tab) for the .csv files and the eventual tables. The schema is
+written in cerberus syntax; it is translated to JSON Schema and compiled with the fastjsonschema
+library, so we can validate the output against it to ensure it is correct.
 
 ## Shape Element Function
 The function should take as input an iterparse Element object and return a dictionary.
@@ -154,15 +155,18 @@ The final return value for a "way" element should look something like:
                'value': '366409'}]}
 """
 
+import collections
+import concurrent.futures
 import csv
-import codecs
-import pprint
+import operator
+import os
 import re
-import xml.etree.cElementTree as ET
 
-import cerberus
+import fastjsonschema
+from lxml import etree as ET
 
 import schema
+from clean import audit_phone_number, audit_url, clean_phone_number, clean_url
 
 OSM_PATH = "ex_h59MB33V6XrsLWjzXhs7CWHwY3NCz.osm"
 
@@ -174,9 +178,17 @@ WAY_TAGS_PATH = "ways_tags.csv"
 
 LOWER_COLON = re.compile(r'^([a-z]|_)+:([a-z]|_)+')
 PROBLEMCHARS = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
+# Same characters as PROBLEMCHARS, checked with set.isdisjoint instead of a regex search
+_PROBLEM_SET = frozenset('=+/&<>;\'"?%#$@,. \t\r\n')
 
 SCHEMA = schema.schema
 
+# JSON Schema types of the cerberus types used in the schema
+_JSON_TYPES = {'string': 'string', 'integer': 'integer', 'float': 'number', 'number': 'number',
+               'boolean': 'boolean', 'dict': 'object', 'list': 'array'}
+# Strings accepted for a field whose rules coerce the value with int or float
+_COERCE_PATTERNS = {int: r'^\s*[+-]?\d+\s*$', float: r'^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$'}
+
 # Make sure the fields order in the csvs matches the column order in the sql table schema
 NODE_FIELDS = ['id', 'lat', 'lon', 'user', 'uid', 'version', 'changeset', 'timestamp']
 NODE_TAGS_FIELDS = ['id', 'key', 'value', 'type']
@@ -184,10 +196,23 @@ WAY_FIELDS = ['id', 'user', 'uid', 'version', 'changeset', 'timestamp']
 WAY_TAGS_FIELDS = ['id', 'key', 'value', 'type']
 WAY_NODES_FIELDS = ['id', 'node_id', 'position']
 
+# Number of elements collected before the buffered rows are written to the csvs
+WRITE_BATCH_SIZE = 10000
+# Number of elements handed to a worker process at once
+SHAPE_BATCH_SIZE = 1000
+
+# Fetch all csv fields of an element's attributes in a single call
+_NODE_GET = operator.itemgetter(*NODE_FIELDS)
+_WAY_GET = operator.itemgetter(*WAY_FIELDS)
+
 
 def shape_element(element, node_attr_fields=NODE_FIELDS, way_attr_fields=WAY_FIELDS,
-                  problem_chars=PROBLEMCHARS, default_tag_type='regular'):
-    """Clean and shape node or way XML element to Python dict"""
+                  problem_chars=PROBLEMCHARS, default_tag_type='regular', audit_failures=None):
+    """Clean and shape node or way XML element to Python dict
+
+    Phone numbers and urls that are still invalid after cleaning are appended to audit_failures
+    (if given) as (element id, tag key, raw value, cleaned value).
+    """
 
     node_attribs = {}
     way_attribs = {}
@@ -195,47 +220,41 @@ def shape_element(element, node_attr_fields=NODE_FIELDS, way_attr_fields=WAY_FIE
     tags = []  # Handle secondary tags the same way for both node and way elements
 
     # YOUR CODE HERE
-    if element.tag == 'node':
-        node_attribs['id'] = element.attrib['id']
-        node_attribs['user'] = element.attrib['user']
-        node_attribs['uid'] = element.attrib['uid']
-        node_attribs['version'] = element.attrib['version']
-        node_attribs['lat'] = element.attrib['lat']
-        node_attribs['lon'] = element.attrib['lon']
-        node_attribs['timestamp'] = element.attrib['timestamp']
-        node_attribs['changeset'] = element.attrib['changeset']
-    # print(node_attribs)
-    elif element.tag == 'way':
-        way_attribs['id'] = element.attrib['id']
-        way_attribs['user'] = element.attrib['user']
-        way_attribs['uid'] = element.attrib['uid']
-        way_attribs['version'] = element.attrib['version']
-        way_attribs['timestamp'] = element.attrib['timestamp']
-        way_attribs['changeset'] = element.attrib['changeset']
-
-    for tg in element.iter('tag'):
-        tag_dict_node = {}
-        tag_dict_node['id'] = element.attrib['id']
-        if tg.attrib['k'] == 'url':
-            tag_dict_node['key'] = clean_url(tg.attrib['v'])
-        if tg.attrib['k'] == element.attrib['id']:
-            tag_dict_node['key'] = clean_phone_number(tg.attrib['v'])
+    tag = element.tag
+    attrib = element.attrib
+    element_id = attrib['id']
+    if tag == 'node':
+        node_attribs = dict(zip(NODE_FIELDS, _NODE_GET(attrib)))
+    elif tag == 'way':
+        way_attribs = dict(zip(WAY_FIELDS, _WAY_GET(attrib)))
+        way_nodes = [{'id': element_id, 'node_id': nd.get('ref'), 'position': i}
+                     for i, nd in enumerate(element.iterchildren('nd'))]
+
+    # Bind what the tag loop uses to local names, which are cheaper to look up than globals/attributes
+    problem_set = _PROBLEM_SET
+    append_tag = tags.append
+    for tg in element.iterchildren('tag'):
+        k = tg.get('k')
+        if not problem_set.isdisjoint(k):
+            continue
+        v = tg.get('v')
+        if k == 'url':
+            raw, v = v, clean_url(v)
+            if not audit_url(v) and audit_failures is not None:
+                audit_failures.append((element_id, k, raw, v))
+        elif k == 'phone':
+            raw, v = v, clean_phone_number(v)
+            if not audit_phone_number(v) and audit_failures is not None:
+                audit_failures.append((element_id, k, raw, v))
+        tag_type, colon, key = k.partition(':')
+        if colon:
+            append_tag({'id': element_id, 'key': key, 'value': v, 'type': tag_type})
         else:
-            tag_dict_node['key'] = tg.attrib['k']
-        if re.search(PROBLEMCHARS, tg.attrib['k']):
-            pass
-        tag_dict_node['value'] = tg.attrib['v']
-        if ':' not in tg.attrib['k']:
-            tag_dict_node['type'] = 'regular'
-        else:
-            tag_type = tg.attrib['k'].split(':')[0]
-            tag_dict_node['type'] = tag_type
-        # print(tag_dict_node)
-        tags.append(tag_dict_node)
+            append_tag({'id': element_id, 'key': k, 'value': v, 'type': default_tag_type})
 
-    if element.tag == 'node':
+    if tag == 'node':
         return {'node': node_attribs, 'node_tags': tags}
-    elif element.tag == 'way':
+    elif tag == 'way':
         return {'way': way_attribs, 'way_nodes': way_nodes, 'way_tags': tags}
 
 
@@ -243,112 +262,110 @@ def shape_element(element, node_attr_fields=NODE_FIELDS, way_attr_fields=WAY_FIE
 #               Helper Functions                     #
 # ================================================== #
 def get_element(osm_file, tags=('node', 'way', 'relation')):
-    """Yield element if it is the right type of tag"""
-
-    context = ET.iterparse(osm_file, events=('start', 'end'))
-    _, root = next(context)
-    for event, elem in context:
-        if event == 'end' and elem.tag in tags:
-            yield elem
-            root.clear()
+    """Yield element if it is the right type of tag
 
+    Pass the path of the OSM file rather than an opened file: libxml2 then reads the file itself,
+    which is faster than pulling it through a Python file object, even one with a large buffer.
+    """
 
-def validate_element(element, validator, schema=SCHEMA):
+    # Top level elements that are not wanted still have to be cleared, otherwise they
+    # (e.g. all relations when only nodes and ways are requested) pile up under the root
+    for _, elem in ET.iterparse(osm_file, events=('end',), tag=('node', 'way', 'relation')):
+        if elem.tag in tags:
+            yield elem
+        elem.clear()
+        # drop the already processed siblings so the tree does not grow with the file
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def cerberus_to_json_schema(schema):
+    """Translate a cerberus schema (field name -> rules) to a JSON Schema object definition"""
+    return {
+        'type': 'object',
+        'properties': {field: rules_to_json_schema(rules) for field, rules in schema.items()},
+        'required': [field for field, rules in schema.items() if rules.get('required')],
+        'additionalProperties': False,
+    }
+
+
+def rules_to_json_schema(rules):
+    """Translate the cerberus rules of a single field to a JSON Schema definition"""
+    definition = {}
+    for rule, value in rules.items():
+        if rule == 'type':
+            definition['type'] = [_JSON_TYPES[t] for t in value] if isinstance(value, list) else _JSON_TYPES[value]
+        elif rule == 'schema':
+            if rules.get('type') == 'dict':
+                definition.update(cerberus_to_json_schema(value))
+            else:
+                definition['items'] = rules_to_json_schema(value)
+        elif rule == 'allowed':
+            definition['enum'] = list(value)
+        elif rule == 'regex':
+            definition['pattern'] = '^(?:{0})$'.format(value)
+        elif rule not in ('required', 'coerce', 'nullable'):
+            raise ValueError("Unsupported cerberus rule '{0}'".format(rule))
+
+    coerce = rules.get('coerce')
+    if coerce is not None:
+        if coerce not in _COERCE_PATTERNS:
+            raise ValueError("Unsupported cerberus coercion {0!r}".format(coerce))
+        definition = {'anyOf': [definition, {'type': 'string', 'pattern': _COERCE_PATTERNS[coerce]}]}
+    if rules.get('nullable'):
+        definition = {'anyOf': [definition, {'type': 'null'}]}
+    return definition
+
+
+# Compiled once per process (every worker imports this module); validating is a plain function call
+VALIDATE = fastjsonschema.compile(cerberus_to_json_schema(SCHEMA))
+
+
+def validate_element(element, validate=VALIDATE):
     """Raise ValidationError if element does not match schema"""
-    if validator.validate(element, schema) is not True:
-        field, errors = next(iter(validator.errors.items()))
+    try:
+        validate(element)
+    except fastjsonschema.JsonSchemaValueException as error:
+        field = error.path[1] if len(error.path) > 1 else error.name
         message_string = "\nElement of type '{0}' has the following errors:\n{1}"
-        error_string = pprint.pformat(errors)
 
-        raise Exception(message_string.format(field, error_string))
+        raise Exception(message_string.format(field, error.message))
 
 
-class UnicodeDictWriter(csv.DictWriter, object):
-    """Extend csv.DictWriter to handle Unicode input"""
+def shape_batch(elements, validate):
+    """Shape and optionally validate a batch of serialized XML elements, run in a worker process
 
-    def writerow(self, row):
-        super(UnicodeDictWriter, self).writerow({
-            k: (v.encode('utf-8') if isinstance(v, str) else v) for k, v in list(row.items())
-        })
+    Returns the shaped elements and the audit failures of the batch, so the parent can report them
+    in file order.
+    """
+    shaped = []
+    audit_failures = []
+    for element in elements:
+        el = shape_element(ET.fromstring(element), audit_failures=audit_failures)
+        if el:
+            if validate is True:
+                validate_element(el)
+            shaped.append(el)
+    return shaped, audit_failures
 
-    def writerows(self, rows):
-        for row in rows:
-            self.writerow(row)
 
-# ================================================== #
-#          Data Cleaning Functions                   #
-# ================================================== #
+def print_audit_failures(audit_failures):
+    """Print the phone numbers and urls that are still invalid after cleaning"""
+    for element_id, key, raw, cleaned in audit_failures:
+        print("{0} {1}: {2!r} -> {3!r}".format(element_id, key, raw, cleaned))
 
-def clean_url(url):
-    if "www." not in url:
-        url = "www." + url
-    if "http://" not in url:
-        url = "http://" + url
-        return url
-
-def clean_phone_number(phone_number):
-
-    #remove all non-digit characters except plus and minus sign
-    non_decimal = re.compile(r"[^\d\s+\s-]")
-    phone_number = non_decimal.sub(" ", phone_number)
-
-    #remove duplicate spaces
-    phone_number = re.sub(' +', ' ', phone_number)
-
-    #check if minus sign is between area code and phone number, if yes, remove it
-    phone_numbers_re2 = re.compile(r"^([+0-9]{3}|[0-9]{3,5})-")
-    m1 = phone_numbers_re2.search(phone_number)
-    if m1:
-        phone_number = phone_number.replace("-", " ", 1)
-
-    #remove space at the beginning of phone number
-
-    if phone_number[0] == " ":
-        phone_number = phone_number.replace(" ", "", 1)
-
-
-    #check if space is between area code and phone number, if not, insert it
-    prefixes_fixed = ["9131 ", "9135 ", "911 ", "9133 ", "320 ", "700 ", "800 ", "900 ", "1511 ", "1512 ", "1514 ",
-                      "1515 ", "1517 ", "160 ", "170 ", "171 ", "175 ", "1520 ", "1522 ", "1523 ", "1525 ", "162 ",
-                      "172 ", "173 ", "174 ", "1570 ", "1573 ", "1575 ", "1577 ", "1578 ", "163 ", "177 ", "178 ",
-                      "1590 ", "176 ", "179 ", "1516 ", "180 "]
-    prefixes_4_digits = ["0911", "0320", "0700", "0800", "0900", "0160", "0170", "0171", "0175", "0162", "0172", "0173",
-                         "0174", "0163", "0177", "0178", "0176", "0179", "0180"]
-    prefixes_5_digits = ["09131", "09135", "09133", "01511", "01512", "01514", "01515", "01517", "01520", "01522",
-                         "01523", "01525", "01570", "01573", "01575", "01577", "01578", "01590", "01516", "09128"]
-    prefixes_international_3_digits = ["911", "951", "320", "700", "800", "900", "160", "170", "171", "175", "162",
-                                       "172", "173", "174", "163", "177", "178", "176", "179", "180"]
-    prefixes_international_4_digits = ["9131", "9135", "9133", "9132" "1511", "1512", "1514", "1515", "1517", "1520",
-                                       "1522", "1523", "1525", "1570", "1573", "1575", "1577", "1578", "1590", "1516",
-                                       "9128"]
-    if phone_number:
-        if not any(code in phone_number for code in prefixes_fixed):
-            #remove all blanks
-            phone_number = phone_number.replace(" ", "")
-            #insert space after country code
-            if phone_number[0] == "+":
-                phone_number = phone_number[:3] + " " + phone_number[3:]
-                if any(code in phone_number for code in prefixes_international_3_digits):
-                    phone_number = phone_number[:7] + " " + phone_number[7:]
-                if any(code in phone_number for code in prefixes_international_4_digits):
-                    phone_number = phone_number[:8] + " " + phone_number[8:]
-
-            if any(code in phone_number for code in prefixes_4_digits):
-                phone_number = phone_number[:4] + " " + phone_number[4:]
-            elif any(code in phone_number for code in prefixes_5_digits):
-                phone_number = phone_number[:5] + " " + phone_number[5:]
-            if "0049" in phone_number:
-                phone_number = phone_number.replace("0049", "+49 ")
-            if " -" in phone_number:
-                phone_number = phone_number.replace("-", "", 1)
-
-        return phone_number
+
+def flush_buffers(buffers):
+    """Write the buffered rows of every (writer, rows) pair and empty the buffers"""
+    for writer, rows in buffers:
+        writer.writerows(rows)
+        rows.clear()
 
 
 # ================================================== #
 #               Main Function                        #
 # ================================================== #
-def process_map(file_in, validate):
+def process_map(file_in, validate, workers=None):
     """Iteratively process each XML element and write to csv(s)"""
 
     with open(NODES_PATH, 'w', encoding='utf8') as nodes_file, \
@@ -369,22 +386,62 @@ def process_map(file_in, validate):
         way_nodes_writer.writeheader()
         way_tags_writer.writeheader()
 
-        validator = cerberus.Validator()
-
-        for element in get_element(file_in, tags=('node', 'way')):
-            el = shape_element(element)
-
-            if el:
-                if validate is True:
-                    validate_element(el, validator)
-
-                if element.tag == 'node':
-                    nodes_writer.writerow(el['node'])
-                    node_tags_writer.writerows(el['node_tags'])
-                elif element.tag == 'way':
-                    ways_writer.writerow(el['way'])
-                    way_nodes_writer.writerows(el['way_nodes'])
-                    way_tags_writer.writerows(el['way_tags'])
+        node_buf, node_tags_buf, way_buf, way_nodes_buf, way_tags_buf = [], [], [], [], []
+        buffers = ((nodes_writer, node_buf), (node_tags_writer, node_tags_buf), (ways_writer, way_buf),
+                   (way_nodes_writer, way_nodes_buf), (way_tags_writer, way_tags_buf))
+
+        def write_element(el):
+            if 'node' in el:
+                node_buf.append(el['node'])
+                node_tags_buf.extend(el['node_tags'])
+            else:
+                way_buf.append(el['way'])
+                way_nodes_buf.extend(el['way_nodes'])
+                way_tags_buf.extend(el['way_tags'])
+
+            if len(node_buf) + len(way_buf) >= WRITE_BATCH_SIZE:
+                flush_buffers(buffers)
+
+        def write_batch(future):
+            shaped, audit_failures = future.result()
+            print_audit_failures(audit_failures)
+            for el in shaped:
+                write_element(el)
+
+        workers = workers or os.cpu_count() or 1
+        if validate is not True or workers == 1:
+            # Shaping alone is cheaper than serializing each element for a worker and unpickling
+            # the result, so only the (much slower) validating run is spread over processes
+            audit_failures = []
+            for element in get_element(file_in, tags=('node', 'way')):
+                el = shape_element(element, audit_failures=audit_failures)
+                if audit_failures:
+                    print_audit_failures(audit_failures)
+                    audit_failures.clear()
+                if el:
+                    if validate is True:
+                        validate_element(el)
+                    write_element(el)
+        else:
+            # Shaping and validation run in worker processes, parsing and writing stay in this one.
+            # Batches are written in the order they were submitted, so the csvs keep the file order.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = collections.deque()
+                batch = []
+                for element in get_element(file_in, tags=('node', 'way')):
+                    batch.append(ET.tostring(element, with_tail=False))
+                    if len(batch) == SHAPE_BATCH_SIZE:
+                        pending.append(pool.submit(shape_batch, batch, validate))
+                        batch = []
+                        # do not let the parser run arbitrarily far ahead of the writer
+                        if len(pending) > 2 * workers:
+                            write_batch(pending.popleft())
+                if batch:
+                    pending.append(pool.submit(shape_batch, batch, validate))
+                while pending:
+                    write_batch(pending.popleft())
+
+        flush_buffers(buffers)
 
 
 if __name__ == '__main__':